@@ -11,34 +11,48 @@ Examples:
 """
 
 import http.server
-import socketserver
+import socket
 import os
 import sys
-import base64
+import errno
+import select
 import mimetypes
 from pathlib import Path
-from urllib.parse import quote, unquote
+from urllib.parse import quote, unquote, urlsplit, parse_qs
 import io
 import subprocess
-import gzip
 import json
-from threading import Lock
-import zipfile
+import hashlib
+from threading import BoundedSemaphore, Lock, local
+from collections import OrderedDict
+import zlib
+import mmap
+import struct
+import itertools
+import time
 import tempfile
+import multiprocessing
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 try:
     from PIL import Image
 except ImportError:
     Image = None
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Parse command line arguments
 SERVE_PATH = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else "."
 PORT = int(sys.argv[2]) if len(sys.argv) > 2 else (int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 4098)
 BIND_ADDRESS = sys.argv[3] if len(sys.argv) > 3 else "0.0.0.0"
 
 # Validate and resolve the serve path
-if not os.path.isabs(SERVE_PATH):
-    SERVE_PATH = os.path.abspath(SERVE_PATH)
+SERVE_PATH = os.path.normpath(os.path.abspath(SERVE_PATH))
+SERVE_PREFIX = SERVE_PATH + os.sep  # Separator-terminated so /srv/foo doesn't pass for root /srv/fo
 
 if not os.path.exists(SERVE_PATH):
     print(f"❌ Error: Path does not exist: {SERVE_PATH}")
@@ -49,110 +63,257 @@ if not os.path.isdir(SERVE_PATH):
     sys.exit(1)
 
 # Optimization: In-memory thumbnail cache
-THUMBNAIL_CACHE = {}
-CACHE_LOCK = Lock()
+# Split into stripes, each with its own lock, so request threads rarely contend
+CACHE_SHARD_COUNT = 16
+THUMBNAIL_CACHE = [OrderedDict() for _ in range(CACHE_SHARD_COUNT)]  # LRU order
+CACHE_LOCKS = [Lock() for _ in range(CACHE_SHARD_COUNT)]
 MAX_CACHE_SIZE = 500  # Limit cache to prevent memory bloat
 
+# Persistent thumbnail store: WebP files named by a hash of the source path and mtime
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'thumbnail-server'))
+
+# Thumbnails are fetched by the browser from this URL instead of being inlined in the listing
+THUMBNAIL_URL = '/_thumb'
+
+# Worker processes for generating a page's image thumbnails in parallel (created on first use)
+THUMBNAIL_POOL = None
+THUMBNAIL_POOL_LOCK = Lock()
+
+# Threads running FFmpeg for video thumbnails; the pool size caps how many FFmpegs run at once
+VIDEO_THUMBNAIL_POOL = None
+
+# Seconds a thumbnail request waits for a queued video thumbnail before answering 503,
+# so request threads don't pile up behind the FFmpeg pool
+VIDEO_THUMBNAIL_WAIT = 1
+THUMBNAIL_PENDING = object()  # get_thumbnail() result while a video thumbnail is still queued
+
+# Optimization: LRU cache of rendered (compressed) directory pages
+# Striped like the thumbnail cache so concurrent listings don't queue on one lock
+# Each page is stored with its entries' (name, mtime, size), re-checked on every hit
+DIR_CACHE = [OrderedDict() for _ in range(CACHE_SHARD_COUNT)]
+DIR_CACHE_LOCKS = [Lock() for _ in range(CACHE_SHARD_COUNT)]
+MAX_DIR_CACHE_SIZE = 100
+
+# LRU of each directory's sorted (name, is_dir) entries, so its other pages skip the listing and sort
+# Keyed on the directory mtime like the page cache; sizes and mtimes aren't kept, since editing a
+# file in place doesn't touch the directory
+ENTRIES_CACHE = OrderedDict()
+ENTRIES_CACHE_LOCK = Lock()
+MAX_ENTRIES_CACHE_SIZE = 32
+
 # Pagination settings
 ITEMS_PER_PAGE = 50
 
+# Number of server processes sharing the port via SO_REUSEPORT (each has its own caches);
+# 'auto' starts one per CPU core
+WEB_PROCESSES = os.environ.get('WEB_PROCESSES', '1')
+WEB_PROCESSES = (os.cpu_count() or 1) if WEB_PROCESSES == 'auto' else max(1, int(WEB_PROCESSES))
+
+# Request-handling threads per process; each serves one connection at a time, idle keep-alive
+# ones included, so the default leaves room for several browsers' 6 connections each
+WEB_WORKERS = max(1, int(os.environ.get('WEB_WORKERS', max(32, (os.cpu_count() or 1) * 4))))
+
+# Seconds an idle keep-alive connection may hold a worker thread before it's closed
+KEEPALIVE_TIMEOUT = 15
+
+# Socket send buffer for connections, so a compressed listing goes out without blocking on the client;
+# set SEND_BUFFER_SIZE=0 to leave it to the OS (Linux stops auto-tuning a buffer that is set explicitly)
+SEND_BUFFER_SIZE = max(0, int(os.environ.get('SEND_BUFFER_SIZE', 256 * 1024)))
+
+# Max bytes handed to a single sendfile() call
+SENDFILE_CHUNK_SIZE = 1 << 20
+
+# Compression settings (fast levels suit on-the-fly HTTP compression)
+# GZIP_LEVEL=3 or so trades some CPU for smaller pages on slow links
+GZIP_LEVEL = min(9, max(1, int(os.environ.get('GZIP_LEVEL', 1))))
+ZSTD_LEVEL = 3
+
+# Zstandard compressors are reused, but can't be shared between threads
+ZSTD_LOCAL = local()
+
+# MIME types by lowercased extension, looked up directly instead of through mimetypes.guess_type()
+# Media types some Python versions and systems lack are registered first so every lookup agrees
+for mime_type, ext in (('image/webp', '.webp'), ('video/x-matroska', '.mkv'), ('video/x-m4v', '.m4v'),
+                       ('audio/flac', '.flac'), ('text/markdown', '.md')):
+    mimetypes.add_type(mime_type, ext)
+EXT_MIME = {ext.lower(): mime_type for ext, mime_type in mimetypes.types_map.items()}
+
+# How the listing shows each extension's files, worked out once from its MIME type:
+# (icon, has_thumbnail, is_video, is_viewable); viewable files open in the browser instead of downloading
+VIEWABLE_MIME_TYPES = ('image/', 'video/', 'audio/', 'text/', 'application/pdf', 'application/json')
+EXT_DISPLAY = {}
+for ext, mime_type in EXT_MIME.items():
+    if mime_type.startswith('image/'):
+        icon = '🖼️'
+    elif mime_type.startswith('video/'):
+        icon = '🎬'
+    elif mime_type.startswith('audio/'):
+        icon = '🎵'
+    elif mime_type == 'application/pdf':
+        icon = '📄'
+    elif mime_type.startswith('text/'):
+        icon = '📝'
+    elif 'archive' in mime_type or 'zip' in mime_type or 'rar' in mime_type:
+        icon = '📦'
+    else:
+        icon = '📁'
+    is_video = mime_type.startswith('video/')
+    has_thumbnail = is_video or (mime_type.startswith('image/') and Image is not None)
+    EXT_DISPLAY[ext] = (icon, has_thumbnail, is_video, mime_type.startswith(VIEWABLE_MIME_TYPES))
+DEFAULT_EXT_DISPLAY = ('📁', False, False, False)
+
+# Formats that are already compressed and gain nothing from deflate
+PRECOMPRESSED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp4', '.mkv', '.webm', '.mov', '.avi', '.m4v', '.flv', '.wmv',
+    '.mp3', '.aac', '.m4a', '.ogg', '.opus', '.flac',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.docx', '.xlsx', '.pptx', '.odt', '.epub', '.jar', '.apk',
+}
+
+# Optimization: In-memory cache of compressed text files
+COMPRESSED_CACHE = OrderedDict()  # LRU order
+COMPRESSED_CACHE_LOCK = Lock()
+MAX_COMPRESSED_CACHE_SIZE = 100
+MAX_COMPRESSED_FILE_SIZE = 1024 * 1024  # Larger files are compressed as a stream instead
+MIN_COMPRESS_SIZE = 1400  # Smaller files already fit in one TCP segment and are sent as-is
+
+# Open files kept around for Range requests (video seeking asks for many ranges of one file)
+# Striped like the thumbnail cache; each stripe is an LRU of SharedFile objects
+FILE_CACHE_SHARD_COUNT = 16
+OPEN_FILE_CACHE = [OrderedDict() for _ in range(FILE_CACHE_SHARD_COUNT)]
+OPEN_FILE_LOCKS = [Lock() for _ in range(FILE_CACHE_SHARD_COUNT)]
+MAX_OPEN_FILES = 64
+# Seconds an unused descriptor stays open; closing it lets the disk space of a deleted file be freed
+OPEN_FILE_IDLE_TIMEOUT = 30
+
+
+# Static parts of the directory listing page, kept in assets/ next to this file:
+# the <head> up to the stylesheet, and the upload/download panels and video
+# player modal with their scripts
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+with open(os.path.join(ASSETS_DIR, 'listing_head.html'), 'rb') as f:
+    LISTING_HEAD = f.read()
+with open(os.path.join(ASSETS_DIR, 'listing_panels.html'), 'rb') as f:
+    LISTING_PANELS = f.read()
+
+# Fixed markup around the per-directory parts, encoded once
+LISTING_BREADCRUMB_HOME = '<div class="breadcrumb"><a href="/">🏠 Home</a>'.encode('utf-8')
+LISTING_ROWS_START = LISTING_PANELS + b'\n<div class="container">'
+LISTING_TAIL = b'\n</body>\n</html>'
+
+# The head is gzipped once at startup and sync-flushed; each listing continues
+# the stream from a copy of this compressor, so it only compresses its own part
+LISTING_HEAD_COMPRESSOR = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+LISTING_HEAD_GZIP = LISTING_HEAD_COMPRESSOR.compress(LISTING_HEAD) + LISTING_HEAD_COMPRESSOR.flush(zlib.Z_SYNC_FLUSH)
+
+# Per-row templates of the directory listing, filled in with str.format()
+PARENT_ROW = (
+    '<div class="item directory"><a href="{url}">'
+    '<div class="thumbnail">⬆️</div><div class="info"><div class="name">..</div></div></a></div>'
+)
+DIRECTORY_ROW = (
+    '<div class="item directory"><a href="{url}">'
+    '<div class="thumbnail">📁</div><div class="info"><div class="name">{name}</div></div></a></div>'
+)
+FILE_ROW = (
+    '<div class="item" id="{item_id}">'
+    '<div class="item-header" style="position: relative; z-index: 10;">'
+    '<input type="checkbox" class="file-checkbox" value="{value}" onchange="toggleFileSelect(this); document.getElementById(\'{item_id}\').classList.toggle(\'selected\');">'
+    '<span style="flex: 1; font-size: 12px; margin-left: 5px;">{name}</span>'
+    '</div>'
+    '<a {link}>{thumbnail}<div class="info"><div class="name"></div><div class="size">{size}</div></div></a>'
+    '</div>'
+)
+# Videos play in the page's modal; other viewable files open in a new tab
+VIDEO_LINK = 'href="#" onclick="playVideo(\'{value}\', \'{url}\'); event.stopPropagation();"'
+FILE_LINK = 'href="{url}"{target}'
+PAGE_LINK = '<a href="{url}?page={page}">{label}</a>'
+ICON_THUMBNAIL = '<div class="thumbnail">{icon}</div>'
+
+# Units of format_size(), each 1024 times the last
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
 
 class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """HTTP request handler with thumbnail support, caching, compression, and file upload."""
 
-    def end_headers(self):
-        """Add cache and compression headers."""
-        # Add compression
-        self.send_header('Content-Encoding', 'gzip')
-        self.send_header('Cache-Control', 'public, max-age=3600')  # Cache for 1 hour
-        super().end_headers()
+    # Keep-alive lets a browser fetch a page and its files over one connection
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT  # Frees the worker thread from clients that go quiet
+    cache_control_sent = False
+    response_started = False
+    # Set TCP_NODELAY so small responses aren't held back by Nagle's algorithm
+    disable_nagle_algorithm = True
+
+    def handle_one_request(self):
+        """Handle one request of a (possibly kept-alive) connection."""
+        self.response_started = False
+        super().handle_one_request()
 
     def send_response(self, code, message=None):
-        """Override to add compression support."""
+        """Start a response, noting it so a later failure doesn't send a second one."""
+        self.response_started = True
         super().send_response(code, message)
 
-    def wfile_write_compressed(self, data):
-        """Compress and write data to client."""
-        if isinstance(data, str):
-            data = data.encode('utf-8')
-        compressed = gzip.compress(data, compresslevel=6)
-        self.wfile.write(compressed)
+    def abort_response(self, code, message):
+        """Report a failure: as an error response if none was started, else by dropping the connection."""
+        if not self.response_started:
+            self.send_error(code, message)
+            return
+        # Whatever follows the partial body would be read as part of it; the client sees it cut short instead
+        self.close_connection = True
+        self.log_error("%s", message)
 
     def do_POST(self):
         """Handle file uploads and downloads."""
-        path = unquote(self.path)
-        
-        # Remove query string if present
-        if '?' in path:
-            path = path.split('?')[0]
+        path = unquote(urlsplit(self.path).path)
 
         # Get target directory
         fs_path = os.path.normpath(os.path.join(SERVE_PATH, path.lstrip('/')))
         
         # Security check
-        if not os.path.normpath(fs_path).startswith(os.path.normpath(SERVE_PATH)):
+        if not is_inside_serve_path(fs_path):
             self.send_error(403, "Access denied")
+            self.close_connection = True  # The unread request body would corrupt the next request
             return
 
-        # Check if this is a download request
         content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length) if content_length > 0 else b''
-        
-        # Parse the body to check if it's a download or upload
-        body_str = body.decode('utf-8', errors='ignore')
-        
-        if 'files_to_download=' in body_str:
-            # Handle file download
-            self.handle_download(body_str, path)
+        content_type = self.headers.get('Content-Type', '')
+
+        # Download requests are small url-encoded forms; read them whole
+        if 'multipart/form-data' not in content_type:
+            body = self.rfile.read(content_length) if content_length > 0 else b''
+            body_str = body.decode('utf-8', errors='ignore')
+            if 'files_to_download=' in body_str:
+                self.handle_download(body_str, path)
+            else:
+                self.send_error(400, "Invalid content type")
             return
-        
-        # Handle file upload (multipart form data)
+
+        # Handle file upload (multipart form data), streamed to disk as it arrives
         if not os.path.isdir(fs_path):
             self.send_error(400, "Target must be a directory")
+            self.close_connection = True
             return
 
         try:
-            content_type = self.headers.get('Content-Type', '')
-            if 'multipart/form-data' not in content_type:
-                self.send_error(400, "Invalid content type")
-                return
-
             # Extract boundary
-            boundary = content_type.split('boundary=')[1].encode()
-            
-            # Parse multipart data
-            parts = body.split(b'--' + boundary)
-            uploaded_count = 0
-            
-            for part in parts[1:-1]:  # Skip first empty and last closing
-                if b'filename=' not in part:
-                    continue
-                
-                # Extract filename
-                filename_start = part.find(b'filename="') + len(b'filename="')
-                filename_end = part.find(b'"', filename_start)
-                filename = part[filename_start:filename_end].decode('utf-8')
-                
-                # Extract file content
-                content_start = part.find(b'\r\n\r\n') + 4
-                content_end = part.rfind(b'\r\n')
-                file_content = part[content_start:content_end]
-                
-                # Save file
-                if filename:
-                    file_path = os.path.join(fs_path, os.path.basename(filename))
-                    with open(file_path, 'wb') as f:
-                        f.write(file_content)
-                    uploaded_count += 1
+            boundary = content_type.split('boundary=')[1].split(';')[0].strip().strip('"').encode()
+            reader = MultipartReader(self.rfile, content_length, boundary)
+            uploaded_count = reader.save_files(fs_path)
             
             # Send success response
+            message = f"✅ Successfully uploaded {uploaded_count} file(s)".encode()
             self.send_response(200)
             self.send_header('Content-type', 'text/plain')
+            self.send_header('Content-Length', str(len(message)))
             self.end_headers()
-            self.wfile.write(f"✅ Successfully uploaded {uploaded_count} file(s)".encode())
+            self.wfile.write(message)
             
         except Exception as e:
-            self.send_error(500, f"Upload failed: {str(e)}")
+            self.abort_response(500, f"Upload failed: {str(e)}")
+            self.close_connection = True
 
     def handle_download(self, body_str, path):
         """Handle file download (single or multiple files as ZIP)."""
@@ -174,7 +335,7 @@ class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 file_path = os.path.normpath(os.path.join(fs_path, file_name))
                 
                 # Security check
-                if not os.path.normpath(file_path).startswith(os.path.normpath(SERVE_PATH)):
+                if not is_inside_serve_path(file_path):
                     self.send_error(403, "Access denied")
                     return
                 
@@ -186,96 +347,78 @@ class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.send_zip_download(fs_path, files_list)
             
         except Exception as e:
-            self.send_error(500, f"Download failed: {str(e)}")
+            self.abort_response(500, f"Download failed: {str(e)}")
 
     def send_file_download(self, file_path, file_name):
         """Send a single file for download."""
         try:
-            file_size = os.path.getsize(file_path)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/octet-stream')
-            self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
-            self.send_header('Content-Length', str(file_size))
-            self.end_headers()
-            
+            # Opened before the status line, so an unreadable file still gets an error response
             with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(65536)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
+                file_size = os.fstat(f.fileno()).st_size
+
+                self.send_response(200)
+                self.send_header('Content-type', 'application/octet-stream')
+                self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
+                self.send_header('Content-Length', str(file_size))
+                self.end_headers()
+
+                self.send_body_from_file(f, 0, file_size)
+        except PermissionError:
+            self.abort_response(403, "Permission denied")
         except Exception as e:
-            self.send_error(500, f"Download failed: {str(e)}")
+            self.abort_response(500, f"Download failed: {str(e)}")
 
     def send_zip_download(self, base_path, files_list):
-        """Create and send a ZIP file with multiple selected files."""
+        """Stream a ZIP file with multiple selected files to the client as it's built."""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/zip')
+        self.send_header('Content-Disposition', 'attachment; filename="download.zip"')
+        body = self.start_streamed_body()
+        
         try:
-            # Create a temporary ZIP file
-            temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-            temp_zip_path = temp_zip.name
-            temp_zip.close()
-            
-            with zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file_name in files_list:
-                    file_path = os.path.normpath(os.path.join(base_path, file_name))
-                    
-                    # Security check
-                    if not os.path.normpath(file_path).startswith(os.path.normpath(SERVE_PATH)):
-                        continue
-                    
-                    if os.path.isfile(file_path):
-                        # Add file to ZIP with relative path
-                        zf.write(file_path, arcname=file_name)
-            
-            # Send the ZIP file
-            file_size = os.path.getsize(temp_zip_path)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/zip')
-            self.send_header('Content-Disposition', 'attachment; filename="download.zip"')
-            self.send_header('Content-Length', str(file_size))
-            self.end_headers()
-            
-            with open(temp_zip_path, 'rb') as f:
-                while True:
-                    chunk = f.read(65536)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
-            
-            # Clean up temp file
-            os.remove(temp_zip_path)
+            zf = ZipStream(body, self.copy_to_client)
+            for file_name in files_list:
+                file_path = os.path.normpath(os.path.join(base_path, file_name))
+                
+                # Security check
+                if not is_inside_serve_path(file_path):
+                    continue
+                
+                if os.path.isfile(file_path):
+                    # Add file to ZIP with relative path; media is stored as-is and sent with sendfile()
+                    if is_precompressed(file_name):
+                        zf.add_stored(file_path, file_name)
+                    else:
+                        zf.add_deflated(file_path, file_name)
+            zf.close()
+            body.finish()
             
         except Exception as e:
-            self.send_error(500, f"ZIP creation failed: {str(e)}")
+            # Headers are already out; dropping the connection tells the client the archive is incomplete
+            self.close_connection = True
+            self.log_error("ZIP creation failed: %s", e)
 
     def do_GET(self):
         """Handle GET requests."""
-        path = unquote(self.path)
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        query = parse_qs(url.query)
+
+        if path == THUMBNAIL_URL:
+            self.send_thumbnail(query.get('p', [''])[0])
+            return
         
         # Extract page number from query string
-        page = 1
-        if '?' in path:
-            query_string = path.split('?')[1]
-            path = path.split('?')[0]
-            # Parse page parameter
-            for param in query_string.split('&'):
-                if param.startswith('page='):
-                    try:
-                        page = int(param.split('=')[1])
-                        if page < 1:
-                            page = 1
-                    except (ValueError, IndexError):
-                        page = 1
-        else:
-            path = path.split('?')[0]
+        try:
+            page = max(1, int(query.get('page', ['1'])[0]))
+        except ValueError:
+            page = 1
 
         # Check if path is a directory
         fs_path = os.path.normpath(os.path.join(SERVE_PATH, path.lstrip('/')))
         
         # Security check: ensure path is within serve directory
-        if not os.path.normpath(fs_path).startswith(os.path.normpath(SERVE_PATH)):
+        if not is_inside_serve_path(fs_path):
             self.send_error(403, "Access denied")
             return
 
@@ -291,32 +434,101 @@ class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         # File not found
         self.send_error(404, "File not found")
 
+    def do_HEAD(self):
+        """Handle HEAD requests with the headers a GET would send, without producing a body."""
+        path = unquote(urlsplit(self.path).path)
+        fs_path = os.path.normpath(os.path.join(SERVE_PATH, path.lstrip('/')))
+
+        # Same security check as GET
+        if not is_inside_serve_path(fs_path):
+            self.send_error(403, "Access denied")
+            return
+
+        if os.path.isdir(fs_path):
+            # A listing's length is only known once it's rendered, so none is given
+            encoding = self.choose_encoding()
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html; charset=utf-8')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        # send_file() stops after the headers for HEAD, so both methods send the same ones
+        if os.path.isfile(fs_path):
+            self.send_file(fs_path)
+            return
+
+        self.send_error(404, "File not found")
+
+    def send_thumbnail(self, rel_path):
+        """Serve the thumbnail of an image or video as binary, cacheable for as long as the file is unchanged."""
+        fs_path = os.path.normpath(os.path.join(SERVE_PATH, rel_path.lstrip('/')))
+        if not is_inside_serve_path(fs_path) or not os.path.isfile(fs_path):
+            self.send_error(404, "File not found")
+            return
+
+        # The listing puts the mtime and size in the URL, so a changed file gets a new URL
+        st = os.stat(fs_path)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        data = get_thumbnail(fs_path, st.st_mtime, st.st_size)
+        if data is THUMBNAIL_PENDING:
+            # The page's script retries after a while
+            self.send_response(503)
+            self.send_header('Retry-After', '2')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if not data:
+            self.send_error(404, "No thumbnail")
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'image/webp' if data[8:12] == b'WEBP' else 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.end_headers()
+        self.wfile.write(data)
+
     def send_file(self, file_path):
-        """Send a file to the client with range request support for video seeking."""
+        """Send a file to the client with range request support for video seeking.
+
+        For HEAD requests only the headers are sent.
+        """
         try:
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if mime_type is None:
-                mime_type = 'application/octet-stream'
+            mime_type = guess_mime_type(file_path) or 'application/octet-stream'
             
             file_size = os.path.getsize(file_path)
             
-            # Check for range request (video seeking)
+            # Check for range request (video seeking); it's settled before any header goes out
             range_header = self.headers.get('Range')
-            
+            byte_range = None
             if range_header:
-                # Parse Range header (e.g., "bytes=1000-2000")
                 try:
-                    range_start, range_end = range_header.replace('bytes=', '').split('-')
-                    range_start = int(range_start) if range_start else 0
-                    range_end = int(range_end) if range_end else file_size - 1
-                    
-                    # Validate range
-                    if range_start >= file_size or range_end >= file_size:
-                        range_start = 0
-                        range_end = file_size - 1
-                    
-                    content_length = range_end - range_start + 1
-                    
+                    byte_range = parse_byte_range(range_header, file_size)
+                except ValueError:
+                    self.send_response(416)  # Range Not Satisfiable
+                    self.send_header('Content-Range', f'bytes */{file_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+            if byte_range:
+                range_start, range_end = byte_range
+                content_length = range_end - range_start + 1
+
+                # Send requested range from a shared, already-open descriptor; opened before
+                # the status line, so an unreadable file still gets an error response
+                shared = acquire_open_file(file_path)
+                try:
                     self.send_response(206)  # Partial Content
                     self.send_header('Content-type', mime_type)
                     self.send_header('Content-Length', str(content_length))
@@ -324,65 +536,222 @@ class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_header('Accept-Ranges', 'bytes')
                     self.send_header('Cache-Control', 'public, max-age=86400')
                     self.end_headers()
-                    
-                    # Send requested range
-                    with open(file_path, 'rb') as f:
-                        f.seek(range_start)
-                        remaining = content_length
-                        while remaining > 0:
-                            chunk_size = min(65536, remaining)
-                            chunk = f.read(chunk_size)
-                            if not chunk:
-                                break
-                            self.wfile.write(chunk)
-                            remaining -= len(chunk)
-                except Exception:
-                    # Fall back to full file send
-                    self.send_full_file(file_path, file_size, mime_type)
+
+                    if self.command != 'HEAD':
+                        self.send_body_from_file(shared.file, range_start, content_length)
+                finally:
+                    release_open_file(file_path, shared)
             else:
-                # Don't compress video files
-                should_compress = mime_type in ['text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript']
+                # Only compress text; media and archives are already compressed, and files
+                # that fit in one packet gain nothing from it
+                compress = is_compressible(mime_type) and file_size >= MIN_COMPRESS_SIZE
+                encoding = self.choose_encoding() if compress else None
                 
                 self.send_response(200)
                 self.send_header('Content-type', mime_type)
-                
-                if should_compress:
-                    self.send_header('Content-Encoding', 'gzip')
-                    self.end_headers()
-                    with open(file_path, 'rb') as f:
-                        compressed = gzip.compress(f.read(), compresslevel=6)
-                        self.wfile.write(compressed)
+                # Compressed or not, the file is cached the same way
+                self.send_header('Accept-Ranges', 'bytes')  # Ranges are served uncompressed
+                self.send_header('Cache-Control', 'public, max-age=86400')  # Cache for 24 hours
+                if compress:
+                    self.send_header('Vary', 'Accept-Encoding')
+
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                    if file_size <= MAX_COMPRESSED_FILE_SIZE:
+                        compressed = get_compressed_file(file_path, encoding)
+                        self.send_header('Content-Length', str(len(compressed)))
+                        self.end_headers()
+                        if self.command != 'HEAD':
+                            self.wfile.write(compressed)
+                    else:
+                        # Compressed length isn't known up front
+                        with open(file_path, 'rb') as f:
+                            body = self.start_streamed_body()
+                            if self.command != 'HEAD':
+                                stream_compressed(f, body, encoding)
+                                body.finish()
                 else:
-                    self.send_header('Content-Length', str(file_size))
-                    self.send_header('Accept-Ranges', 'bytes')  # Advertise range support
-                    self.send_header('Cache-Control', 'public, max-age=86400')  # Cache for 24 hours
-                    self.end_headers()
-                    
-                    self.send_full_file(file_path, file_size, mime_type)
+                    with open(file_path, 'rb') as f:
+                        self.send_header('Content-Length', str(file_size))
+                        self.end_headers()
+
+                        if self.command != 'HEAD':
+                            self.send_body_from_file(f, 0, file_size)
+        except PermissionError:
+            self.abort_response(403, "Permission denied")
         except Exception as e:
-            self.send_error(500, f"Error serving file: {str(e)}")
+            self.abort_response(500, f"Error serving file: {str(e)}")
 
-    def send_full_file(self, file_path, file_size, mime_type):
-        """Send complete file in chunks."""
-        with open(file_path, 'rb') as f:
-            remaining = file_size
-            while remaining > 0:
-                chunk_size = min(65536, remaining)  # 64KB chunks
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                self.wfile.write(chunk)
-                remaining -= len(chunk)
+    def start_streamed_body(self):
+        """End the headers of a response whose length isn't known and return a StreamedBody for it."""
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            # HTTP/1.0 clients don't understand chunks; closing the connection ends the body
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        return StreamedBody(self.wfile, chunked)
+
+    def choose_encoding(self, codings=('zstd', 'gzip')):
+        """Pick the first of codings the client accepts ('zstd', 'gzip' or None)."""
+        accepted = {}
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            coding, _, params = item.partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip().lower()] = quality
+
+        for coding in codings:
+            if coding == 'zstd' and not zstandard:
+                continue
+            if accepted.get(coding, 0) > 0:
+                return coding
+        return None
+
+    def send_body_from_file(self, f, offset, count):
+        """Send a response body of count bytes, already announced in Content-Length, from an open file."""
+        if self.copy_to_client(f, offset, count):
+            # The body is short of its Content-Length; abort_response() drops the connection
+            raise OSError("File changed size while sending")
+
+    def copy_to_client(self, f, offset, count):
+        """Copy count bytes of an open file, starting at offset, to the client.
+
+        Uses the zero-copy sendfile() syscall where the OS supports it and
+        falls back to a chunked read/write loop otherwise (e.g. on Windows).
+        Returns the number of bytes left unsent because the file was shorter.
+        """
+        # Headers may still be sitting in the write buffer
+        self.wfile.flush()
+
+        if hasattr(os, 'sendfile'):
+            sock = self.connection
+            while count > 0:
+                try:
+                    sent = os.sendfile(sock.fileno(), f.fileno(), offset, min(count, SENDFILE_CHUNK_SIZE))
+                except BlockingIOError:
+                    # Sockets with a timeout are non-blocking underneath; wait until writable
+                    if not select.select([], [sock], [], sock.gettimeout())[1]:
+                        raise TimeoutError("Timed out sending file")
+                    continue
+                except OSError as e:
+                    if e.errno in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                        break  # sendfile() not supported for this file, use the fallback
+                    raise
+                if sent == 0:
+                    return count  # File was truncated while sending
+                offset += sent
+                count -= sent
+
+        # pread() leaves the file position alone, so descriptors shared between threads stay safe
+        if hasattr(os, 'pread'):
+            read = lambda size: os.pread(f.fileno(), size, offset)
+        else:
+            f.seek(offset)
+            read = f.read
+        while count > 0:
+            chunk = read(min(65536, count))  # 64KB chunks
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            offset += len(chunk)
+            count -= len(chunk)
+        return count
 
     def list_directory(self, path, page=1):
-        """Generate HTML directory listing with thumbnails and pagination."""
+        """Send the HTML directory listing, re-rendering it only when the page's entries changed."""
+        # Adding, removing or renaming entries bumps the directory mtime; editing a file
+        # in place doesn't, so the page's own files are re-stat()ed and compared too
+        encoding = self.choose_encoding()
         try:
-            entries = os.listdir(path)
+            mtime_ns = os.stat(path).st_mtime_ns
+            listing = get_listing_page(path, mtime_ns, page)
         except PermissionError:
             self.send_error(403, "Permission denied")
             return
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        cache_key = (path, mtime_ns, listing[0], encoding)
+        fingerprint = tuple((name, st.st_mtime_ns, st.st_size) if st else (name,) for name, st in listing[3])
+
+        shard_index = hash(cache_key) % CACHE_SHARD_COUNT
+        lock, shard = DIR_CACHE_LOCKS[shard_index], DIR_CACHE[shard_index]
+        with lock:
+            cached = shard.get(cache_key)
+            body = None
+            if cached is not None and cached[0] == fingerprint:
+                body = cached[1]
+                shard.move_to_end(cache_key)
+
+        if body is not None:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html; charset=utf-8')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Not cached: send the page as it's rendered, keeping a copy for the cache
+        parts = self.render_directory(path, listing)
+        first_part = next(parts)
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        stream = self.start_streamed_body()
+        body = bytearray()
+
+        def send(data):
+            stream.write(data)
+            body.extend(data)
 
-        entries.sort(key=lambda x: (not os.path.isdir(os.path.join(path, x)), x.lower()))
+        try:
+            if encoding == 'gzip':
+                compressor = LISTING_HEAD_COMPRESSOR.copy()
+                send(LISTING_HEAD_GZIP)
+            elif encoding == 'zstd':
+                compressor = zstd_compressor().compressobj()
+                send(compressor.compress(LISTING_HEAD) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+            else:
+                compressor = None
+                send(LISTING_HEAD)
+            stream.flush()  # The browser can start on the stylesheet right away
+
+            for part in itertools.chain([first_part], parts):
+                send(compressor.compress(part) if compressor else part)
+            if compressor:
+                send(compressor.flush())
+            stream.finish()
+        except Exception as e:
+            # Headers are already out; dropping the connection tells the client the page is incomplete
+            self.close_connection = True
+            self.log_error("Listing failed: %s", e)
+            return
+
+        with lock:
+            shard[cache_key] = (fingerprint, bytes(body))
+            if len(shard) > MAX_DIR_CACHE_SIZE // CACHE_SHARD_COUNT:
+                shard.popitem(last=False)
+
+    def render_directory(self, path, listing):
+        """Generate the HTML directory listing after LISTING_HEAD with thumbnails and pagination.
+
+        listing is a get_listing_page() result. Yields the page in a few UTF-8 parts
+        so it can be sent while it's built.
+        """
+        page, total_pages, entry_count, paginated_entries = listing
 
         # Build the HTML
         rel_path = os.path.relpath(path, SERVE_PATH).replace('\\', '/')
@@ -390,551 +759,1014 @@ class ThumbnailHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             rel_path = ''
 
         display_path = '/' + rel_path if rel_path else '/'
+        # Quoted once; '/' stays as-is, so every other link on the page is sliced from this
+        quoted_path = quote(display_path)
 
-        html_parts = [
-            '<!DOCTYPE html>',
-            '<html>',
-            '<head>',
-            '<meta charset="utf-8">',
-            '<meta name="viewport" content="width=device-width, initial-scale=1.0">',
-            '<title>File Browser - ' + display_path + '</title>',
-            '<style>',
-            'body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }',
-            'h1 { color: #333; margin-bottom: 10px; }',
-            '.header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; }',
-            '.breadcrumb { margin-bottom: 20px; }',
-            '.breadcrumb a { color: #0066cc; text-decoration: none; margin: 0 5px; }',
-            '.breadcrumb a:hover { text-decoration: underline; }',
-            '.upload-section { background: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }',
-            '.upload-area { border: 2px dashed #0066cc; border-radius: 8px; padding: 30px; text-align: center; cursor: pointer; transition: background 0.3s; }',
-            '.upload-area:hover { background: #f0f7ff; }',
-            '.upload-area.dragover { background: #e3f2fd; border-color: #1976d2; }',
-            '.upload-area p { margin: 0 0 10px 0; color: #666; }',
-            '.file-input { display: none; }',
-            '.upload-btn { background: #0066cc; color: white; border: none; padding: 10px 20px; border-radius: 4px; cursor: pointer; font-size: 14px; }',
-            '.upload-btn:hover { background: #0052a3; }',
-            '.upload-progress { margin-top: 10px; display: none; }',
-            '.progress-bar { width: 100%; height: 4px; background: #e0e0e0; border-radius: 2px; overflow: hidden; }',
-            '.progress-fill { height: 100%; background: #0066cc; width: 0%; transition: width 0.3s; }',
-            '.upload-status { margin-top: 10px; padding: 10px; border-radius: 4px; display: none; }',
-            '.upload-status.success { background: #e8f5e9; color: #2e7d32; }',
-            '.upload-status.error { background: #ffebee; color: #c62828; }',
-            '.container { display: grid; grid-template-columns: repeat(auto-fill, minmax(150px, 1fr)); gap: 20px; }',
-            '.item { background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 4px rgba(0,0,0,0.1); transition: transform 0.2s, box-shadow 0.2s; cursor: pointer; }',
-            '.item:hover { transform: translateY(-5px); box-shadow: 0 8px 16px rgba(0,0,0,0.15); }',
-            '.item a { text-decoration: none; color: inherit; display: flex; flex-direction: column; height: 100%; }',
-            '.thumbnail { width: 100%; height: 120px; background: #e8e8e8; display: flex; align-items: center; justify-content: center; font-size: 48px; overflow: hidden; }',
-            '.thumbnail img { width: 100%; height: 100%; object-fit: cover; }',
-            '.info { padding: 10px; flex: 1; display: flex; flex-direction: column; justify-content: space-between; }',
-            '.name { font-weight: 500; word-break: break-word; font-size: 13px; }',
-            '.size { font-size: 11px; color: #666; margin-top: 5px; }',
-            '.directory .thumbnail { background: #e3f2fd; }',
-            '.pagination { text-align: center; margin-top: 40px; padding: 20px; }',
-            '.pagination a, .pagination span { display: inline-block; padding: 8px 12px; margin: 0 4px; border-radius: 4px; }',
-            '.pagination a { background: #0066cc; color: white; text-decoration: none; cursor: pointer; }',
-            '.pagination a:hover { background: #0052a3; }',
-            '.pagination .current { background: #333; color: white; padding: 8px 12px; border-radius: 4px; }',
-            '.pagination .disabled { color: #ccc; cursor: not-allowed; }',
-            '.pagination-info { color: #666; font-size: 14px; margin-bottom: 10px; }',
-            '.item.selected { background: #e3f2fd; box-shadow: 0 0 0 2px #0066cc; }',
-            '.file-checkbox { margin-right: 8px; cursor: pointer; width: 18px; height: 18px; }',
-            '.item-header { display: flex; align-items: center; padding: 10px; background: #f9f9f9; border-bottom: 1px solid #e0e0e0; }',
-            '.modal { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.8); z-index: 1000; align-items: center; justify-content: center; }',
-            '.modal.show { display: flex; }',
-            '.modal-content { background: white; border-radius: 8px; max-width: 90%; max-height: 90%; overflow: auto; position: relative; }',
-            '.modal-header { padding: 15px; background: #333; color: white; display: flex; justify-content: space-between; align-items: center; border-radius: 8px 8px 0 0; }',
-            '.modal-close { background: none; border: none; color: white; font-size: 24px; cursor: pointer; }',
-            '.video-player { width: 100%; max-width: 800px; }',
-            '.video-player video { width: 100%; height: auto; }',
-            '</style>',
-            '</head>',
-            '<body>',
-            '<div class="header">',
-            '<h1>📂 ' + display_path + '</h1>',
-            '</div>',
-        ]
+        buf = bytearray()
+        buf += (
+            f'\n<title>File Browser - {display_path}</title>\n</head>\n<body>\n'
+            f'<div class="header">\n<h1>📂 {display_path}</h1>\n</div>\n'
+        ).encode('utf-8')
 
         # Breadcrumb navigation
         if rel_path:
-            html_parts.append('<div class="breadcrumb">')
-            html_parts.append('<a href="/">🏠 Home</a>')
-            parts = rel_path.split('/')
+            buf += LISTING_BREADCRUMB_HOME
             current = ''
-            for part in parts:
-                current += '/' + part if current else '/' + part
-                html_parts.append(f' / <a href="{quote(current)}">{part}</a>')
-            html_parts.append('</div>')
-
-        # Upload section
-        html_parts.extend([
-            '<div class="upload-section">',
-            '<form id="uploadForm" class="upload-area" ondrop="handleDrop(event)" ondragover="handleDragOver(event)" ondragleave="handleDragLeave(event)">',
-            '<input type="file" id="fileInput" class="file-input" multiple onchange="handleFileSelect(event)">',
-            '<p><strong>📁 Drag files here or click to select</strong></p>',
-            '<p style="font-size: 12px; color: #999;">Select multiple files to upload</p>',
-            '<button type="button" class="upload-btn" onclick="document.getElementById(\'fileInput\').click()">Choose Files</button>',
-            '<div class="upload-progress" id="uploadProgress">',
-            '<div class="progress-bar"><div class="progress-fill" id="progressFill"></div></div>',
-            '</div>',
-            '<div class="upload-status" id="uploadStatus"></div>',
-            '</form>',
-            '</div>',
-            '<script>',
-            'function handleDragOver(e) {',
-            '  e.preventDefault();',
-            '  e.stopPropagation();',
-            '  document.getElementById("uploadForm").classList.add("dragover");',
-            '}',
-            'function handleDragLeave(e) {',
-            '  e.preventDefault();',
-            '  e.stopPropagation();',
-            '  document.getElementById("uploadForm").classList.remove("dragover");',
-            '}',
-            'function handleDrop(e) {',
-            '  e.preventDefault();',
-            '  e.stopPropagation();',
-            '  document.getElementById("uploadForm").classList.remove("dragover");',
-            '  const files = e.dataTransfer.files;',
-            '  uploadFiles(files);',
-            '}',
-            'function handleFileSelect(e) {',
-            '  uploadFiles(e.target.files);',
-            '}',
-            'function uploadFiles(files) {',
-            '  if (files.length === 0) return;',
-            '  const formData = new FormData();',
-            '  for (let i = 0; i < files.length; i++) {',
-            '    formData.append("files", files[i]);',
-            '  }',
-            '  const progressDiv = document.getElementById("uploadProgress");',
-            '  const statusDiv = document.getElementById("uploadStatus");',
-            '  progressDiv.style.display = "block";',
-            '  statusDiv.style.display = "none";',
-            '  fetch(window.location.pathname, {',
-            '    method: "POST",',
-            '    body: formData',
-            '  })',
-            '  .then(response => response.text())',
-            '  .then(data => {',
-            '    progressDiv.style.display = "none";',
-            '    statusDiv.style.display = "block";',
-            '    statusDiv.className = "upload-status success";',
-            '    statusDiv.textContent = data;',
-            '    document.getElementById("fileInput").value = "";',
-            '    setTimeout(() => location.reload(), 2000);',
-            '  })',
-            '  .catch(error => {',
-            '    progressDiv.style.display = "none";',
-            '    statusDiv.style.display = "block";',
-            '    statusDiv.className = "upload-status error";',
-            '    statusDiv.textContent = "❌ Upload failed: " + error;',
-            '  });',
-            '}',
-            '</script>',
-        ])
-
-        # Add download section
-        html_parts.extend([
-            '<div class="download-section" id="downloadSection" style="display: none; background: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">',
-            '<div style="display: flex; justify-content: space-between; align-items: center;">',
-            '<div>',
-            '<input type="checkbox" id="selectAll" onchange="toggleSelectAll(this)"> <strong>Select All</strong>',
-            '<span id="selectedCount" style="margin-left: 20px; color: #666;">0 selected</span>',
-            '</div>',
-            '<button class="upload-btn" onclick="downloadSelected()" style="background: #28a745;">⬇️ Download Selected</button>',
-            '</div>',
-            '</div>',
-            '<script>',
-            'const selectedFiles = new Set();',
-            '',
-            'function toggleSelectAll(checkbox) {',
-            '  const checkboxes = document.querySelectorAll(".file-checkbox");',
-            '  checkboxes.forEach(cb => {',
-            '    cb.checked = checkbox.checked;',
-            '    const item = cb.closest(".item");',
-            '    if (checkbox.checked) {',
-            '      selectedFiles.add(cb.value);',
-            '      item.classList.add("selected");',
-            '    } else {',
-            '      selectedFiles.delete(cb.value);',
-            '      item.classList.remove("selected");',
-            '    }',
-            '  });',
-            '  updateSelectedCount();',
-            '}',
-            '',
-            'function toggleFileSelect(checkbox) {',
-            '  console.log("Toggling:", checkbox.value, "Checked:", checkbox.checked);',
-            '  if (checkbox.checked) {',
-            '    selectedFiles.add(checkbox.value);',
-            '  } else {',
-            '    selectedFiles.delete(checkbox.value);',
-            '  }',
-            '  console.log("Selected files:", Array.from(selectedFiles));',
-            '  updateSelectedCount();',
-            '}',
-            '',
-            'function updateSelectedCount() {',
-            '  const count = selectedFiles.size;',
-            '  document.getElementById("selectedCount").textContent = count + " selected";',
-            '  const downloadSection = document.getElementById("downloadSection");',
-            '  downloadSection.style.display = count > 0 ? "block" : "none";',
-            '}',
-            '',
-            'function downloadSelected() {',
-            '  if (selectedFiles.size === 0) {',
-            '    alert("Please select files to download");',
-            '    return;',
-            '  }',
-            '  console.log("Downloading:", Array.from(selectedFiles));',
-            '  const form = document.createElement("form");',
-            '  form.method = "POST";',
-            '  form.action = window.location.pathname;',
-            '  const filesInput = document.createElement("input");',
-            '  filesInput.type = "hidden";',
-            '  filesInput.name = "files_to_download";',
-            '  filesInput.value = Array.from(selectedFiles).join(",");',
-            '  form.appendChild(filesInput);',
-            '  document.body.appendChild(form);',
-            '  form.submit();',
-            '  document.body.removeChild(form);',
-            '}',
-            '</script>',
-        ])
-
-        # Add video player modal
-        html_parts.extend([
-            '<div id="videoModal" class="modal">',
-            '<div class="modal-content">',
-            '<div class="modal-header">',
-            '<span id="videoTitle"></span>',
-            '<button class="modal-close" onclick="closeVideoPlayer()">&times;</button>',
-            '</div>',
-            '<div class="video-player">',
-            '<video id="videoPlayer" controls preload="metadata" style="width: 100%; max-height: 70vh;">',
-            '<source id="videoSource" src="" type="video/mp4">',
-            'Your browser does not support the video tag.',
-            '</video>',
-            '</div>',
-            '</div>',
-            '</div>',
-            '<script>',
-            'function playVideo(filename, filepath) {',
-            '  const videoModal = document.getElementById("videoModal");',
-            '  const videoTitle = document.getElementById("videoTitle");',
-            '  const videoSource = document.getElementById("videoSource");',
-            '  const videoPlayer = document.getElementById("videoPlayer");',
-            '  ',
-            '  videoTitle.textContent = "▶️ " + filename;',
-            '  videoSource.src = filepath;',
-            '  videoSource.type = getMimeType(filename);',
-            '  ',
-            '  videoPlayer.load();',
-            '  videoModal.classList.add("show");',
-            '}',
-            '',
-            'function closeVideoPlayer() {',
-            '  const videoModal = document.getElementById("videoModal");',
-            '  const videoPlayer = document.getElementById("videoPlayer");',
-            '  videoPlayer.pause();',
-            '  videoModal.classList.remove("show");',
-            '}',
-            '',
-            'function getMimeType(filename) {',
-            '  const ext = filename.split(".").pop().toLowerCase();',
-            '  const mimeTypes = {',
-            '    "mp4": "video/mp4",',
-            '    "webm": "video/webm",',
-            '    "ogg": "video/ogg",',
-            '    "mov": "video/quicktime",',
-            '    "avi": "video/x-msvideo",',
-            '    "mkv": "video/x-matroska",',
-            '    "flv": "video/x-flv",',
-            '    "wmv": "video/x-ms-wmv"',
-            '  };',
-            '  return mimeTypes[ext] || "video/mp4";',
-            '}',
-            '',
-            'document.addEventListener("keydown", (e) => {',
-            '  if (e.key === "Escape") closeVideoPlayer();',
-            '});',
-            '',
-            'document.getElementById("videoModal").addEventListener("click", (e) => {',
-            '  if (e.target.id === "videoModal") closeVideoPlayer();',
-            '});',
-            '</script>',
-        ])
-
-        html_parts.append('<div class="container">')
+            for part, quoted_part in zip(rel_path.split('/'), quoted_path[1:].split('/')):
+                current += '/' + quoted_part
+                buf += f' / <a href="{current}">{part}</a>'.encode('utf-8')
+            buf += b'</div>'
+
+        buf += LISTING_ROWS_START
 
         # Add parent directory link
         if rel_path:
-            parent = os.path.dirname(path)
-            parent_rel = os.path.relpath(parent, SERVE_PATH).replace('\\', '/')
-            if parent_rel == '.':
-                parent_url = '/'
-            else:
-                parent_url = '/' + parent_rel
-            html_parts.append(
-                f'<div class="item directory"><a href="{quote(parent_url)}">'
-                f'<div class="thumbnail">⬆️</div><div class="info"><div class="name">..</div></div></a></div>'
-            )
-
-        # Pagination: split entries into pages
-        start_idx = (page - 1) * ITEMS_PER_PAGE
-        end_idx = start_idx + ITEMS_PER_PAGE
-        paginated_entries = entries[start_idx:end_idx]
-        total_pages = (len(entries) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-
-        # Add directory entries
-        for idx, entry in enumerate(paginated_entries):
-            full_path = os.path.join(path, entry)
-            rel = os.path.relpath(full_path, SERVE_PATH).replace('\\', '/')
-            url = '/' + rel if rel != '.' else '/'
-
-            if os.path.isdir(full_path):
-                html_parts.append(
-                    f'<div class="item directory"><a href="{quote(url)}">'
-                    f'<div class="thumbnail">📁</div><div class="info"><div class="name">{entry}</div></div></a></div>'
-                )
+            parent_url = quoted_path.rsplit('/', 1)[0] or '/'
+            buf += PARENT_ROW.format(url=parent_url).encode('utf-8')
+        yield buf
+
+        # Start generating this page's missing thumbnails before the browser asks for them
+        prefetch_thumbnails([(os.path.join(path, name), st) for name, st in paginated_entries if st])
+
+        # Add directory entries; every entry's URL is this directory's URL plus its name
+        quoted_base_url = quoted_path.rstrip('/') + '/'
+        rows = []
+        for idx, (entry, st) in enumerate(paginated_entries):
+            quoted_url = quoted_base_url + quote(entry)
+
+            if st is None:
+                rows.append(DIRECTORY_ROW.format(url=quoted_url, name=entry))
+                continue
+
+            icon, has_thumbnail, is_video, is_viewable = file_display(entry)
+            encoded_entry = entry.replace('"', '&quot;').replace("'", "&#39;")
+            if is_video:
+                link = VIDEO_LINK.format(value=encoded_entry, url=quoted_url)
             else:
-                size = os.path.getsize(full_path)
-                size_str = format_size(size)
-                thumbnail_html = get_thumbnail_html(full_path, entry)
-                
-                # Check if it's a video file
-                mime_type, _ = mimetypes.guess_type(full_path)
-                is_video = mime_type and mime_type.startswith('video/')
-                
-                item_id = f"item-{idx}-{page}"
-                encoded_entry = entry.replace('"', '&quot;').replace("'", "&#39;")
-                
-                # Create onclick handler - play video for videos, open in new tab for other viewables
-                if is_video:
-                    onclick_handler = f'onclick="playVideo(\'{encoded_entry}\', \'{quote(url)}\'); event.stopPropagation();"'
-                    link_content = f'{thumbnail_html}<div class="info"><div class="name"></div><div class="size">{size_str}</div></div>'
-                else:
-                    is_viewable = is_viewable_file(entry)
-                    target = ' target="_blank"' if is_viewable else ''
-                    onclick_handler = ''
-                    link_content = f'{thumbnail_html}<div class="info"><div class="name"></div><div class="size">{size_str}</div></div>'
-                
-                html_parts.append(
-                    f'<div class="item" id="{item_id}">'
-                    f'<div class="item-header" style="position: relative; z-index: 10;">'
-                    f'<input type="checkbox" class="file-checkbox" value="{encoded_entry}" onchange="toggleFileSelect(this); document.getElementById(\'{item_id}\').classList.toggle(\'selected\');">'
-                    f'<span style="flex: 1; font-size: 12px; margin-left: 5px;">{entry}</span>'
-                    f'</div>'
-                    f'<a href="{quote(url) if not is_video else "#"}" {target if not is_video else ""} {onclick_handler}>'
-                    f'{link_content}</a>'
-                    f'</div>'
-                )
-
-        html_parts.extend([
-            '</div>',
-        ])
+                link = FILE_LINK.format(url=quoted_url, target=' target="_blank"' if is_viewable else '')
+            rows.append(FILE_ROW.format(
+                item_id=f"item-{idx}-{page}",
+                value=encoded_entry,
+                name=entry,
+                link=link,
+                thumbnail=(thumbnail_img_html(quoted_url, entry, icon, f'{st.st_mtime_ns:x}-{st.st_size:x}', is_video)
+                           if has_thumbnail else ICON_THUMBNAIL.format(icon=icon)),
+                size=format_size(st.st_size),
+            ))
+        yield ''.join(rows).encode('utf-8')
+
+        buf = bytearray(b'</div>\n')
 
         # Add pagination controls
         if total_pages > 1:
-            html_parts.append('<div class="pagination">')
-            html_parts.append(f'<div class="pagination-info">Page {page} of {total_pages} • Showing {len(paginated_entries)} of {len(entries)} items</div>')
+            page_url = quoted_path
+            nav = [f'<div class="pagination"><div class="pagination-info">Page {page} of {total_pages} • Showing {len(paginated_entries)} of {entry_count} items</div>']
             
             # Previous button
             if page > 1:
-                html_parts.append(f'<a href="{quote(display_path)}?page={page - 1}">← Previous</a>')
+                nav.append(PAGE_LINK.format(url=page_url, page=page - 1, label='← Previous'))
             else:
-                html_parts.append('<span class="disabled">← Previous</span>')
+                nav.append('<span class="disabled">← Previous</span>')
             
             # Page numbers
             start_page = max(1, page - 2)
             end_page = min(total_pages, page + 2)
             
             if start_page > 1:
-                html_parts.append(f'<a href="{quote(display_path)}?page=1">1</a>')
+                nav.append(PAGE_LINK.format(url=page_url, page=1, label=1))
                 if start_page > 2:
-                    html_parts.append('<span>...</span>')
+                    nav.append('<span>...</span>')
             
             for p in range(start_page, end_page + 1):
                 if p == page:
-                    html_parts.append(f'<span class="current">{p}</span>')
+                    nav.append(f'<span class="current">{p}</span>')
                 else:
-                    html_parts.append(f'<a href="{quote(display_path)}?page={p}">{p}</a>')
+                    nav.append(PAGE_LINK.format(url=page_url, page=p, label=p))
             
             if end_page < total_pages:
                 if end_page < total_pages - 1:
-                    html_parts.append('<span>...</span>')
-                html_parts.append(f'<a href="{quote(display_path)}?page={total_pages}">{total_pages}</a>')
+                    nav.append('<span>...</span>')
+                nav.append(PAGE_LINK.format(url=page_url, page=total_pages, label=total_pages))
             
             # Next button
             if page < total_pages:
-                html_parts.append(f'<a href="{quote(display_path)}?page={page + 1}">Next →</a>')
+                nav.append(PAGE_LINK.format(url=page_url, page=page + 1, label='Next →'))
             else:
-                html_parts.append('<span class="disabled">Next →</span>')
+                nav.append('<span class="disabled">Next →</span>')
             
-            html_parts.append('</div>')
+            nav.append('</div>')
+            buf += ''.join(nav).encode('utf-8')
         else:
-            html_parts.append(f'<div style="text-align: center; margin-top: 40px; color: #666;">Showing {len(entries)} item{"s" if len(entries) != 1 else ""}</div>')
+            buf += f'<div style="text-align: center; margin-top: 40px; color: #666;">Showing {entry_count} item{"s" if entry_count != 1 else ""}</div>'.encode('utf-8')
 
-        html_parts.extend([
-            '</body>',
-            '</html>',
-        ])
+        buf += LISTING_TAIL
+        yield buf
 
-        html = '\n'.join(html_parts)
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.send_header('Content-Encoding', 'gzip')
-        compressed_html = gzip.compress(html.encode('utf-8'), compresslevel=6)
-        self.send_header('Content-Length', str(len(compressed_html)))
-        self.end_headers()
-        self.wfile.write(compressed_html)
-        self.wfile.write(html.encode('utf-8'))
+    def send_header(self, keyword, value):
+        """Send a header, noting whether the response set its own caching policy."""
+        if keyword.lower() == 'cache-control':
+            self.cache_control_sent = True
+        super().send_header(keyword, value)
 
     def end_headers(self):
         """Add custom headers."""
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        # Responses without their own policy (listings, errors) must not be cached
+        if not self.cache_control_sent:
+            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.cache_control_sent = False
         super().end_headers()
 
 
-def get_thumbnail_html(file_path, filename):
-    """Generate HTML for file thumbnail (with caching)."""
-    cache_key = f"{file_path}:{os.path.getmtime(file_path)}"
+def get_listing_page(path, mtime_ns, page):
+    """Return (page, total_pages, entry_count, entries) for one page of a directory listing.
+
+    entries holds (name, stat result) pairs, with None for folders. Only this page's
+    files are stat()ed, and freshly on every call.
+    """
+    entries = get_sorted_entries(path, mtime_ns)
+
+    # Pagination: only the current page's entries are rendered; the sorted
+    # list is needed just for the window and the totals in the footer
+    total_pages = max(1, (len(entries) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+    page = min(page, total_pages)
+    start_idx = (page - 1) * ITEMS_PER_PAGE
+    page_entries = []
+    for name, is_dir in entries[start_idx:start_idx + ITEMS_PER_PAGE]:
+        try:
+            st = None if is_dir else os.stat(os.path.join(path, name))
+        except OSError:
+            continue  # Removed since the directory was listed
+        page_entries.append((name, st))
+    return page, total_pages, len(entries), page_entries
+
+
+def get_sorted_entries(path, mtime_ns):
+    """Return a directory's (name, is_dir) entries, folders first then by name (with caching)."""
+    cache_key = (path, mtime_ns)
+    with ENTRIES_CACHE_LOCK:
+        if cache_key in ENTRIES_CACHE:
+            ENTRIES_CACHE.move_to_end(cache_key)
+            return ENTRIES_CACHE[cache_key]
+
+    # One scandir() pass: is_dir() comes from the directory listing itself, no stat per entry
+    with os.scandir(path) as it:
+        entries = sorted(((e.name, e.is_dir()) for e in it), key=lambda e: (not e[1], e[0].lower()))
+
+    with ENTRIES_CACHE_LOCK:
+        ENTRIES_CACHE[cache_key] = entries
+        if len(ENTRIES_CACHE) > MAX_ENTRIES_CACHE_SIZE:
+            ENTRIES_CACHE.popitem(last=False)
+
+    return entries
+
+
+def is_inside_serve_path(fs_path):
+    """Check that an already-normalized path is the serve root or below it."""
+    return fs_path == SERVE_PATH or fs_path.startswith(SERVE_PREFIX)
+
+
+def parse_byte_range(range_header, file_size):
+    """Return the inclusive (start, end) of a single "bytes=" Range header.
+
+    Returns None for headers that must be ignored (malformed, reversed, other
+    units or several ranges) and raises ValueError for ranges that start past
+    the end of the file or are empty suffixes.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep or not (first + last).isdecimal():  # Both parts digits or empty, not both empty
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or file_size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, file_size - length), file_size - 1
+
+    start = int(first)
+    end = int(last) if last else file_size - 1
+    if last and start > end:
+        return None  # Invalid per RFC 9110, so the whole file is sent
+    if start >= file_size:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, file_size - 1)
+
+
+def is_compressible(mime_type):
+    """Check if a MIME type is text-like and worth compressing."""
+    return mime_type.startswith('text/') or mime_type in ('application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def is_precompressed(filename):
+    """Check if a file's format is already compressed (media, archives)."""
+    return os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS
+
+
+def zstd_compressor():
+    """Return this thread's reusable Zstandard compressor."""
+    compressor = getattr(ZSTD_LOCAL, 'compressor', None)
+    if compressor is None:
+        compressor = ZSTD_LOCAL.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor
+
+
+def gzip_compressor(level=GZIP_LEVEL):
+    """Return a zlib compressor producing a gzip stream (wbits=31 adds the gzip header and trailer)."""
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def gzip_compress(data, level=GZIP_LEVEL):
+    """Gzip bytes in one go with a single compressor."""
+    compressor = gzip_compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_data(data, encoding):
+    """Compress bytes with the given content coding ('zstd' or 'gzip')."""
+    if encoding == 'zstd':
+        return zstd_compressor().compress(data)
+    return gzip_compress(data)
+
+
+def stream_compressed(src, dst, encoding):
+    """Compress a file object into another in fixed-size blocks, without buffering it whole."""
+    if encoding == 'zstd':
+        zstd_compressor().copy_stream(src, dst)
+        return
+    compressor = gzip_compressor()
+    while True:
+        chunk = src.read(65536)
+        if not chunk:
+            break
+        dst.write(compressor.compress(chunk))
+    dst.write(compressor.flush())
+
+
+def get_compressed_file(file_path, encoding):
+    """Return the compressed contents of a file (with caching)."""
+    cache_key = (file_path, os.path.getmtime(file_path), encoding)
+
+    with COMPRESSED_CACHE_LOCK:
+        if cache_key in COMPRESSED_CACHE:
+            COMPRESSED_CACHE.move_to_end(cache_key)
+            return COMPRESSED_CACHE[cache_key]
+
+    with open(file_path, 'rb') as f:
+        result = compress_data(f.read(), encoding)
+
+    with COMPRESSED_CACHE_LOCK:
+        COMPRESSED_CACHE[cache_key] = result
+        if len(COMPRESSED_CACHE) > MAX_COMPRESSED_CACHE_SIZE:
+            COMPRESSED_CACHE.popitem(last=False)
+
+    return result
+
+
+def get_thumbnail(file_path, mtime, size):
+    """Return a file's thumbnail bytes, or None if it has none (with caching).
+
+    Returns THUMBNAIL_PENDING for a video whose thumbnail isn't ready within VIDEO_THUMBNAIL_WAIT.
+    """
+    cache_key = f"{file_path}:{mtime}:{size}"
     
-    # Check cache first
-    with CACHE_LOCK:
-        if cache_key in THUMBNAIL_CACHE:
-            return THUMBNAIL_CACHE[cache_key]
+    # Check cache first; if another thread or a worker is already generating it, wait for its result
+    future, is_owner = reserve_thumbnail(cache_key)
+
+    # Videos are left to the FFmpeg pool; this thread only waits briefly for them
+    mime_type = guess_mime_type(file_path)
+    if mime_type and mime_type.startswith('video/'):
+        if is_owner:
+            queue_thumbnail(cache_key, future, get_video_thumbnail_pool, make_video_thumbnail, file_path, mtime, size)
+        wait([future], timeout=VIDEO_THUMBNAIL_WAIT)
+        if not future.done():
+            return THUMBNAIL_PENDING
+        return None if future.exception() else future.result()
+
+    if not is_owner:
+        try:
+            return future.result()
+        except Exception:
+            return render_thumbnail(file_path, mtime, size)  # The other attempt failed; try once more here
     
-    result = None
-    mime_type, _ = mimetypes.guess_type(file_path)
+    try:
+        result = render_thumbnail(file_path, mtime, size)
+    except BaseException as e:
+        abandon_thumbnail(cache_key, future, e)
+        raise
     
+    publish_thumbnail(cache_key, future, result)
+    return result
+
+
+def render_thumbnail(file_path, mtime, size):
+    """Generate the thumbnail bytes for an image (uncached)."""
+    mime_type = guess_mime_type(file_path)
     if mime_type and mime_type.startswith('image/'):
-        if Image:
-            try:
-                img = Image.open(file_path)
-                img.thumbnail((150, 120), Image.Resampling.LANCZOS)
-                buffered = io.BytesIO()
-                img.save(buffered, format='PNG')
-                img_str = base64.b64encode(buffered.getvalue()).decode()
-                result = f'<div class="thumbnail" data-src="data:image/png;base64,{img_str}"><img loading="lazy" src="data:image/png;base64,{img_str}" alt="{filename}"></div>'
-            except Exception:
-                result = '<div class="thumbnail">🖼️</div>'
-        else:
-            result = '<div class="thumbnail">🖼️</div>'
-    
-    # Video thumbnails
-    elif mime_type and mime_type.startswith('video/'):
-        video_thumb = extract_video_thumbnail(file_path)
-        if video_thumb:
-            result = f'<div class="thumbnail" data-src="data:image/png;base64,{video_thumb}"><img loading="lazy" src="data:image/png;base64,{video_thumb}" alt="{filename}"></div>'
+        return make_image_thumbnail(file_path, mtime, size)
+    return None
+
+
+def acquire_open_file(file_path):
+    """Return a SharedFile for reading a file, reusing a cached descriptor if the file is unchanged.
+
+    Pair every call with release_open_file().
+    """
+    # Without pread() threads would fight over the file position, so nothing is shared
+    if not hasattr(os, 'pread'):
+        return SharedFile(open(file_path, 'rb'))
+
+    st = os.stat(file_path)
+    index = hash(file_path) % FILE_CACHE_SHARD_COUNT
+    lock, shard = OPEN_FILE_LOCKS[index], OPEN_FILE_CACHE[index]
+    with lock:
+        shared = shard.get(file_path)
+        if shared is not None and shared.identity == (st.st_ino, st.st_size, st.st_mtime_ns):
+            shard.move_to_end(file_path)
+            shared.users += 1
+            shared.last_used = time.monotonic()
+            return shared
+
+    shared = SharedFile(open(file_path, 'rb'))
+    with lock:
+        shared.users += 1  # The cache's own reference
+        replaced = shard.pop(file_path, None)
+        if replaced is not None:
+            replaced.release()
+        shard[file_path] = shared
+        if len(shard) > MAX_OPEN_FILES // FILE_CACHE_SHARD_COUNT:
+            shard.popitem(last=False)[1].release()
+    return shared
+
+
+def expire_open_files():
+    """Close cached descriptors that no request has used for OPEN_FILE_IDLE_TIMEOUT seconds."""
+    deadline = time.monotonic() - OPEN_FILE_IDLE_TIMEOUT
+    for lock, shard in zip(OPEN_FILE_LOCKS, OPEN_FILE_CACHE):
+        with lock:
+            # Only the cache's own reference left means no request is reading it
+            idle = [path for path, shared in shard.items() if shared.users == 1 and shared.last_used < deadline]
+            for path in idle:
+                shard.pop(path).release()
+
+
+def release_open_file(file_path, shared):
+    """Give back a SharedFile from acquire_open_file(); it's closed once nothing uses it."""
+    index = hash(file_path) % FILE_CACHE_SHARD_COUNT
+    with OPEN_FILE_LOCKS[index]:
+        shared.release()
+
+
+def cache_shard(cache_key):
+    """Return the (lock, dict) stripe of the thumbnail cache holding a key."""
+    index = hash(cache_key) % CACHE_SHARD_COUNT
+    return CACHE_LOCKS[index], THUMBNAIL_CACHE[index]
+
+
+def reserve_thumbnail(cache_key):
+    """Find or reserve the cache slot for a thumbnail.
+
+    Returns (future, is_owner). Only the first caller for a key becomes the owner
+    and must fill the slot with publish_thumbnail(); later callers wait on the future.
+    """
+    lock, shard = cache_shard(cache_key)
+    with lock:
+        future = shard.get(cache_key)
+        if future is not None:
+            shard.move_to_end(cache_key)
+            return future, False
+        future = shard[cache_key] = Future()
+        # Make room by dropping the least recently used thumbnails
+        while len(shard) > MAX_CACHE_SIZE // CACHE_SHARD_COUNT:
+            shard.popitem(last=False)
+        return future, True
+
+
+def publish_thumbnail(cache_key, future, data):
+    """Hand a generated thumbnail to waiting threads; its slot stays cached."""
+    future.set_result(data)
+
+
+def abandon_thumbnail(cache_key, future, error):
+    """Release a reserved slot whose thumbnail couldn't be generated."""
+    lock, shard = cache_shard(cache_key)
+    with lock:
+        shard.pop(cache_key, None)
+    future.set_exception(error)
+
+
+def thumbnail_store_path(file_path, mtime, size):
+    """Return the on-disk thumbnail location for a file (a new one whenever the file changes)."""
+    # Keyed on size too, so a file rewritten within the filesystem's mtime granularity still changes key
+    key = hashlib.blake2b(f"{file_path}:{mtime}:{size}".encode('utf-8'), digest_size=12).hexdigest()
+    return os.path.join(THUMBNAIL_DIR, key + '.webp')
+
+
+def load_stored_thumbnail(store_path):
+    """Read a persisted thumbnail, or None if there isn't one."""
+    try:
+        with open(store_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def save_stored_thumbnail(store_path, data):
+    """Persist a thumbnail; written to a temp file first so readers never see partial data."""
+    try:
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=THUMBNAIL_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, store_path)
+    except OSError:
+        pass
+
+
+def encode_thumbnail(img):
+    """Encode a thumbnail-sized image as WebP bytes."""
+    buffered = io.BytesIO()
+    img.save(buffered, format='WEBP', quality=70, method=0)  # method 0 = fastest encoder
+    return buffered.getvalue()
+
+
+def make_image_thumbnail(file_path, mtime, size):
+    """Return a WebP thumbnail of an image, reusing the persisted one (None on failure)."""
+    store_path = thumbnail_store_path(file_path, mtime, size)
+    data = load_stored_thumbnail(store_path)
+    if data is not None:
+        return data
+    if not Image:
+        return None
+    try:
+        img = Image.open(file_path)
+        # JPEGs decode straight at a reduced scale (no-op for other formats); 2x leaves headroom for the resize
+        img.draft('RGB', (300, 240))
+        # BILINEAR is several times faster than LANCZOS and indistinguishable at this size
+        img.thumbnail((150, 120), Image.Resampling.BILINEAR)
+        data = encode_thumbnail(img)
+    except Exception:
+        return None
+    save_stored_thumbnail(store_path, data)
+    return data
+
+
+def make_video_thumbnail(file_path, mtime, size):
+    """Return a thumbnail frame of a video, reusing the persisted one (None on failure)."""
+    store_path = thumbnail_store_path(file_path, mtime, size)
+    data = load_stored_thumbnail(store_path)
+    if data is not None:
+        return data
+    data = extract_video_thumbnail(file_path)
+    # Re-encode FFmpeg's PNG as WebP for the store; without Pillow it's used as-is
+    if data and Image:
+        try:
+            data = encode_thumbnail(Image.open(io.BytesIO(data)))
+            save_stored_thumbnail(store_path, data)
+        except Exception:
+            pass
+    return data
+
+
+def thumbnail_img_html(quoted_url, filename, icon, version, retry=False):
+    """Generate HTML for a thumbnail image, falling back to an icon if it fails to load.
+
+    With retry, a failed load is retried a few times first (video thumbnails answer 503 while queued).
+    """
+    src = f"{THUMBNAIL_URL}?p={quoted_url}&amp;v={version}"
+    onerror = f"thumbnailFailed(this, '{icon}')" if retry else f"this.parentNode.textContent='{icon}'"
+    # Sized up front so lazy loading knows which images are near the viewport before any has loaded
+    return (
+        f'<div class="thumbnail"><img loading="lazy" decoding="async" width="150" height="120" src="{src}" alt="{filename}" '
+        f'onerror="{onerror}"></div>'
+    )
+
+
+def get_thumbnail_pool():
+    """Return the shared thumbnail worker pool, starting it on first use."""
+    global THUMBNAIL_POOL
+    with THUMBNAIL_POOL_LOCK:
+        if THUMBNAIL_POOL is None:
+            # Forking this multi-threaded process could copy a lock held by another thread, and would
+            # hand the children its sockets, so workers start from a clean forkserver (spawn on Windows)
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            # Server processes split the cores between their pools instead of each taking all of them
+            THUMBNAIL_POOL = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 1) // WEB_PROCESSES),
+                                                 mp_context=multiprocessing.get_context(start_method))
+        return THUMBNAIL_POOL
+
+
+def get_video_thumbnail_pool():
+    """Return the shared FFmpeg thread pool, starting it on first use."""
+    global VIDEO_THUMBNAIL_POOL
+    with THUMBNAIL_POOL_LOCK:
+        if VIDEO_THUMBNAIL_POOL is None:
+            VIDEO_THUMBNAIL_POOL = ThreadPoolExecutor(
+                max_workers=max(1, (os.cpu_count() or 1) // WEB_PROCESSES), thread_name_prefix='ffmpeg')
+        return VIDEO_THUMBNAIL_POOL
+
+
+def prefetch_thumbnails(files):
+    """Queue a page's missing image and video thumbnails on the worker pools without waiting for them.
+
+    files holds (path, stat result) pairs.
+    """
+    for file_path, st in files:
+        mime_type = guess_mime_type(file_path)
+        if not mime_type:
+            continue
+        if mime_type.startswith('image/') and Image:
+            get_pool, make_thumbnail = get_thumbnail_pool, make_image_thumbnail
+        elif mime_type.startswith('video/'):
+            get_pool, make_thumbnail = get_video_thumbnail_pool, make_video_thumbnail
         else:
-            result = '<div class="thumbnail">🎬</div>'
-    
-    # File type icons
-    elif mime_type:
-        if mime_type.startswith('audio/'):
-            result = '<div class="thumbnail">🎵</div>'
-        elif mime_type == 'application/pdf':
-            result = '<div class="thumbnail">📄</div>'
-        elif mime_type.startswith('text/'):
-            result = '<div class="thumbnail">📝</div>'
-        elif 'archive' in mime_type or 'zip' in mime_type or 'rar' in mime_type:
-            result = '<div class="thumbnail">📦</div>'
-    
-    if not result:
-        result = '<div class="thumbnail">📁</div>'
-    
-    # Cache the result
-    with CACHE_LOCK:
-        if len(THUMBNAIL_CACHE) < MAX_CACHE_SIZE:
-            THUMBNAIL_CACHE[cache_key] = result
-    
-    return result
+            continue
+        mtime, size = st.st_mtime, st.st_size
+        cache_key = f"{file_path}:{mtime}:{size}"
+        future, is_owner = reserve_thumbnail(cache_key)
+        if is_owner:
+            queue_thumbnail(cache_key, future, get_pool, make_thumbnail, file_path, mtime, size)
+
+
+def queue_thumbnail(cache_key, future, get_pool, make_thumbnail, file_path, mtime, size):
+    """Generate a reserved thumbnail on a worker pool, publishing it when it's done."""
+    try:
+        job = get_pool().submit(make_thumbnail, file_path, mtime, size)
+    except Exception as e:
+        # No pool; the thumbnail request will try again
+        abandon_thumbnail(cache_key, future, e)
+        return
+    job.add_done_callback(lambda job: finish_prefetch(cache_key, future, job))
+
+
+def finish_prefetch(cache_key, future, job):
+    """Publish a thumbnail generated by a worker pool."""
+    try:
+        data = job.result()
+    except Exception as e:
+        abandon_thumbnail(cache_key, future, e)
+        return
+    publish_thumbnail(cache_key, future, data)
 
 
 def extract_video_thumbnail(video_path, timestamp=2):
-    """Extract a thumbnail from a video file using FFmpeg."""
+    """Extract a thumbnail frame (PNG bytes) from a video file using FFmpeg."""
+    # FFmpeg writes the frame to stdout, so nothing lands in the served folder
+    cmd = [
+        'ffmpeg',
+        '-i', video_path,
+        '-ss', str(timestamp),
+        '-vframes', '1',
+        '-vf', 'scale=150:120:force_original_aspect_ratio=decrease,pad=150:120:(ow-iw)/2:(oh-ih)/2',
+        '-f', 'image2pipe',
+        '-vcodec', 'png',
+        'pipe:1'
+    ]
     try:
-        # Try to use ffmpeg to extract a frame
-        temp_file = os.path.join(os.path.dirname(video_path), f".thumb_{os.getpid()}.png")
-        
-        # Use ffmpeg to extract frame at 2 seconds
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-ss', str(timestamp),
-            '-vframes', '1',
-            '-vf', 'scale=150:120:force_original_aspect_ratio=decrease,pad=150:120:(ow-iw)/2:(oh-ih)/2',
-            '-y',  # Overwrite without asking
-            temp_file
-        ]
-        
-        # Run silently
-        with open(os.devnull, 'w') as devnull:
-            subprocess.run(cmd, stdout=devnull, stderr=devnull, timeout=5)
-        
-        if os.path.exists(temp_file):
+        proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, timeout=5)
+    except Exception:
+        return None
+    return proc.stdout if proc.returncode == 0 and proc.stdout else None
+
+
+def file_crc32(f, size):
+    """Compute the CRC-32 of an open file, mapping it into memory rather than reading it in."""
+    if size == 0:
+        return 0
+    try:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return zlib.crc32(m)
+    except (OSError, ValueError):
+        # Not mappable (e.g. some network filesystems); fall back to reading
+        crc = 0
+        f.seek(0)
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def guess_mime_type(path):
+    """Return the MIME type for a file name's extension, or None if unknown."""
+    return EXT_MIME.get(os.path.splitext(path)[1].lower())
+
+
+def file_display(filename):
+    """Return how the listing shows a file: (icon, has_thumbnail, is_video, is_viewable)."""
+    return EXT_DISPLAY.get(os.path.splitext(filename)[1].lower(), DEFAULT_EXT_DISPLAY)
+
+
+def format_size(bytes_size):
+    """Format bytes to human readable size (whole bytes, otherwise one decimal)."""
+    if bytes_size < 1024:
+        return f"{bytes_size} B"
+    # Each unit is 10 more bits, so the bit length picks it without a loop
+    exponent = min((bytes_size.bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+    value = bytes_size / (1 << (exponent * 10))
+    # Values just under the next unit would round up to "1024.0"
+    if value >= 1023.95 and exponent < len(SIZE_UNITS) - 1:
+        exponent += 1
+        value /= 1024
+    return f"{value:.1f} {SIZE_UNITS[exponent]}"
+
+
+class StreamedBody(io.BufferedIOBase):
+    """Buffered writer for a response body of unknown length.
+
+    Data goes out as HTTP/1.1 chunks, or as-is for HTTP/1.0 clients whose body
+    ends when the connection closes. Call finish() once the body is complete.
+    """
+
+    def __init__(self, wfile, chunked, buffer_size=65536):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.buffer_size = buffer_size
+        self.pending = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending += data
+        if len(self.pending) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.pending:
+            if self.chunked:
+                self.wfile.write(b'%x\r\n%b\r\n' % (len(self.pending), self.pending))
+            else:
+                self.wfile.write(self.pending)
+            self.pending.clear()
+
+    def write_file(self, f, offset, count, copy):
+        """Send a byte range of a file as its own chunk through copy (e.g. sendfile), bypassing the buffer."""
+        if not count:
+            return  # An empty chunk would end the body
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b'%x\r\n' % count)
+        if copy(f, offset, count):
+            raise OSError("File changed size while sending")
+        if self.chunked:
+            self.wfile.write(b'\r\n')
+
+    def finish(self):
+        """Send any buffered data and mark the end of the body."""
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+
+class ZipStream:
+    """Write a ZIP archive front to back onto a StreamedBody, without seeking.
+
+    The payload of a stored entry is handed to copy (the handler's sendfile
+    path), so already-compressed media never passes through Python. Deflated
+    entries are compressed as they're read and end with a data descriptor.
+    Sizes and offsets past 4GB use Zip64 records.
+    """
+
+    ZIP64_LIMIT = 0xFFFFFFFF  # Values from here up are stored in Zip64 fields
+    LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+    CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+    END_RECORD = struct.Struct('<IHHHHIIH')
+    ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+    ZIP64_LOCATOR = struct.Struct('<IIQI')
+
+    def __init__(self, body, copy):
+        self.body = body
+        self.copy = copy
+        self.offset = 0
+        self.entries = []
+
+    def write(self, data):
+        self.body.write(data)
+        self.offset += len(data)
+
+    def start_entry(self, file_path, arcname, method, flags, crc, size, compressed_size, zip64):
+        """Write an entry's local header and remember it for the central directory."""
+        # Cleaned like zipfile's ZipInfo.from_file(): no drive, no "..", no leading separators
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1]).lstrip(os.sep + (os.altsep or ''))
+        name = arcname.replace(os.sep, '/').encode('utf-8')
+        if not name.isascii():
+            flags |= 0x800  # File name is UTF-8
+        st = os.stat(file_path)
+        year, month, day, hour, minute, second = time.localtime(st.st_mtime)[:6]
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((max(year, 1980) - 1980) << 9) | (month << 5) | day
+        extra = b''
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, size, compressed_size)
+            size = compressed_size = 0xFFFFFFFF
+        self.entries.append([name, flags, method, dos_time, dos_date, crc, 0, 0, self.offset, st.st_mode])
+        self.write(self.LOCAL_HEADER.pack(
+            0x04034b50, 45 if zip64 else 20, flags, method, dos_time, dos_date,
+            crc, compressed_size, size, len(name), len(extra)))
+        self.write(name + extra)
+        return self.entries[-1]
+
+    def add_stored(self, file_path, arcname):
+        """Add a file as-is; its CRC is computed up front so the payload can go out with sendfile()."""
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            crc = file_crc32(f, size)
+            entry = self.start_entry(file_path, arcname, 0, 0, crc, size, size, size >= self.ZIP64_LIMIT)
+            self.body.write_file(f, 0, size, self.copy)
+            self.offset += size
+        entry[6] = entry[7] = size
+
+    def add_deflated(self, file_path, arcname):
+        """Add a file deflated at GZIP_LEVEL, streaming it through the compressor."""
+        with open(file_path, 'rb') as f:
+            # Leave room for incompressible data growing slightly, as zipfile does
+            zip64 = os.fstat(f.fileno()).st_size * 1.05 > self.ZIP64_LIMIT
+            entry = self.start_entry(file_path, arcname, 8, 0x08, 0, 0, 0, zip64)
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -15)
+            crc = size = compressed_size = 0
+            while True:
+                chunk = f.read(65536)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                data = compressor.compress(chunk)
+                compressed_size += len(data)
+                self.write(data)
+            data = compressor.flush()
+            compressed_size += len(data)
+            self.write(data)
+        size_format = 'Q' if zip64 else 'I'
+        self.write(struct.pack(f'<II{size_format}{size_format}', 0x08074b50, crc, compressed_size, size))
+        entry[5:8] = [crc, compressed_size, size]
+
+    def close(self):
+        """Write the central directory that ends the archive."""
+        start = self.offset
+        for name, flags, method, dos_time, dos_date, crc, compressed_size, size, offset, mode in self.entries:
+            # Zip64 extra fields hold only the values that don't fit, in this order
+            extra = []
+            if size >= self.ZIP64_LIMIT:
+                extra.append(size)
+                size = 0xFFFFFFFF
+            if compressed_size >= self.ZIP64_LIMIT:
+                extra.append(compressed_size)
+                compressed_size = 0xFFFFFFFF
+            if offset >= self.ZIP64_LIMIT:
+                extra.append(offset)
+                offset = 0xFFFFFFFF
+            extra = struct.pack(f'<HH{len(extra)}Q', 1, 8 * len(extra), *extra) if extra else b''
+            version = 45 if extra else 20
+            self.write(self.CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | version, version, flags, method, dos_time, dos_date,
+                crc, compressed_size, size, len(name), len(extra), 0, 0, 0, (mode & 0xFFFF) << 16, offset))
+            self.write(name + extra)
+
+        count = len(self.entries)
+        directory_size = self.offset - start
+        if count >= 0xFFFF or start >= self.ZIP64_LIMIT or directory_size >= self.ZIP64_LIMIT:
+            end_offset = self.offset
+            self.write(self.ZIP64_END_RECORD.pack(
+                0x06064b50, self.ZIP64_END_RECORD.size - 12, (3 << 8) | 45, 45, 0, 0,
+                count, count, directory_size, start))
+            self.write(self.ZIP64_LOCATOR.pack(0x07064b50, 0, end_offset, 1))
+            count = min(count, 0xFFFF)
+            directory_size = min(directory_size, 0xFFFFFFFF)
+            start = min(start, 0xFFFFFFFF)
+        self.write(self.END_RECORD.pack(0x06054b50, 0, 0, count, count, directory_size, start, 0))
+
+
+class SharedFile:
+    """An open file used by several requests at once, closed when the last one releases it."""
+
+    def __init__(self, file):
+        self.file = file
+        st = os.fstat(file.fileno())
+        self.identity = (st.st_ino, st.st_size, st.st_mtime_ns)  # Detects a replaced or modified file
+        self.users = 1
+        self.last_used = time.monotonic()
+
+    def release(self):
+        """Drop one reference (callers hold the stripe lock for cached files)."""
+        self.users -= 1
+        if self.users == 0:
+            self.file.close()
+
+
+class MultipartReader:
+    """Incremental multipart/form-data parser that streams file parts straight to disk.
+
+    The body is read in 64KB blocks, so memory use stays flat regardless of upload size.
+    """
+
+    def __init__(self, rfile, content_length, boundary):
+        self.rfile = rfile
+        self.remaining = content_length
+        # Every part ends with CRLF--boundary; seeding the buffer with CRLF lets the
+        # opening boundary (which has no CRLF before it) match the same delimiter
+        self.delimiter = b'\r\n--' + boundary
+        self.buffer = b'\r\n'
+
+    def fill(self):
+        """Append the next block of the body to the buffer. Returns False at the end."""
+        if self.remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(65536, self.remaining))
+        if not chunk:
+            self.remaining = 0
+            return False
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def copy_until_delimiter(self, write=None):
+        """Pass the data up to the next delimiter to write() (or drop it) and consume the delimiter."""
+        # A delimiter may straddle two blocks, so hold back a tail that could be its start
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if write:
+                    write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                return
+            if len(self.buffer) > keep:
+                if write:
+                    write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                raise ValueError("Truncated multipart body")
+
+    def read_part_headers(self):
+        """Consume the header block of the current part and return it."""
+        while True:
+            index = self.buffer.find(b'\r\n\r\n')
+            if index >= 0:
+                headers = self.buffer[2:index]  # Skip the CRLF that ends the delimiter line
+                self.buffer = self.buffer[index + 4:]
+                return headers
+            if len(self.buffer) > 65536:
+                raise ValueError("Multipart headers too large")
+            if not self.fill():
+                raise ValueError("Truncated multipart body")
+
+    def save_files(self, dest_dir):
+        """Save every file part into dest_dir and return how many were saved."""
+        uploaded_count = 0
+        self.copy_until_delimiter()  # Skip the preamble
+
+        while True:
+            # After a delimiter, "--" closes the body and CRLF starts another part
+            while len(self.buffer) < 2 and self.fill():
+                pass
+            if self.buffer[:2] != b'\r\n':
+                break
+
+            headers = self.read_part_headers()
+            filename = ''
+            if b'filename="' in headers:
+                filename_start = headers.find(b'filename="') + len(b'filename="')
+                filename_end = headers.find(b'"', filename_start)
+                filename = headers[filename_start:filename_end].decode('utf-8')
+
+            if not filename:
+                self.copy_until_delimiter()
+                continue
+
+            file_path = os.path.join(dest_dir, os.path.basename(filename))
             try:
-                with open(temp_file, 'rb') as f:
-                    img_data = f.read()
-                    img_str = base64.b64encode(img_data).decode()
-                    return img_str
-            finally:
-                # Clean up temp file
+                with open(file_path, 'wb') as f:
+                    self.copy_until_delimiter(f.write)
+            except Exception:
+                # Don't leave a partially written file behind
                 try:
-                    os.remove(temp_file)
-                except:
+                    os.remove(file_path)
+                except OSError:
                     pass
-    except Exception:
-        pass
-    
-    return None
+                raise
+            uploaded_count += 1
 
+        # Drain the epilogue so the connection stays in sync for keep-alive
+        while self.fill():
+            self.buffer = b''
+        return uploaded_count
 
-def is_viewable_file(filename):
-    """Check if a file is viewable in the browser (not downloaded)."""
-    mime_type, _ = mimetypes.guess_type(filename)
-    if not mime_type:
-        return False
-    
-    # Viewable file types
-    viewable_types = [
-        'image/',  # All image types
-        'video/',  # All video types
-        'audio/',  # All audio types
-        'application/pdf',
-        'text/',   # Text files
-        'application/json',
-    ]
-    
-    for viewable in viewable_types:
-        if mime_type.startswith(viewable) or mime_type == viewable:
-            return True
-    
-    return False
 
+class ThumbnailHTTPServer(http.server.HTTPServer):
+    """HTTP server handling connections on a fixed pool of threads.
 
-def format_size(bytes_size):
-    """Format bytes to human readable size."""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}".rstrip('0').rstrip('.')
-        bytes_size /= 1024
-    return f"{bytes_size:.1f} TB"
+    Accepting blocks while every worker is busy, so a burst of connections
+    waits in the listen backlog instead of spawning a thread each. The port
+    can be shared with sibling worker processes.
+    """
 
+    def __init__(self, server_address, handler_class, reuse_port=False):
+        self.reuse_port = reuse_port
+        self.executor = ThreadPoolExecutor(max_workers=WEB_WORKERS, thread_name_prefix='http')
+        self.free_workers = BoundedSemaphore(WEB_WORKERS)
+        self.connections = set()
+        self.connections_lock = Lock()
+        super().__init__(server_address, handler_class)
 
-if __name__ == '__main__':
-    handler = ThumbnailHTTPRequestHandler
-    
-    # Use ThreadingTCPServer for concurrent request handling
-    with socketserver.ThreadingTCPServer((BIND_ADDRESS, PORT), handler) as httpd:
-        print(f"🚀 Server running on http://{BIND_ADDRESS}:{PORT}")
-        print(f"📂 Serving files from: {SERVE_PATH}")
-        print(f"⚡ Optimizations: Caching, Compression, Threading, Pagination")
-        print(f"📊 Cache size limit: {MAX_CACHE_SIZE} thumbnails | Items per page: {ITEMS_PER_PAGE}")
-        print(f"⏹️  Press Ctrl+C to stop")
+    def process_request(self, request, client_address):
+        """Hand a connection to the next free worker thread, waiting for one if needed."""
+        self.free_workers.acquire()
+        with self.connections_lock:
+            self.connections.add(request)
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Serve one connection on a worker thread."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+            self.shutdown_request(request)
+            self.free_workers.release()
+
+    def service_actions(self):
+        """Housekeeping run by serve_forever() between connections (about twice a second)."""
+        expire_open_files()
+
+    def server_close(self):
+        """Stop listening and cut open connections so worker threads exit promptly."""
+        super().server_close()
+        with self.connections_lock:
+            connections = list(self.connections)
+        for request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    def server_bind(self):
+        """Enable SO_REUSEPORT so sibling processes share the port (Linux balances connections between them).
+
+        Also raises the send buffer, which accepted connections inherit.
+        """
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if SEND_BUFFER_SIZE and self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) < SEND_BUFFER_SIZE:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+        super().server_bind()
+
+
+def create_server(reuse_port=False):
+    """Create and bind a server for BIND_ADDRESS:PORT."""
+    return ThumbnailHTTPServer((BIND_ADDRESS, PORT), ThumbnailHTTPRequestHandler, reuse_port)
+
+
+def serve_until_interrupted(httpd):
+    """Serve requests until Ctrl+C."""
+    with httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\n✋ Server stopped")
+            pass
+
+
+def run_worker_process():
+    """Entry point of an additional server process."""
+    serve_until_interrupted(create_server(reuse_port=True))
+
+
+if __name__ == '__main__':
+    if WEB_PROCESSES > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        print("⚠️  SO_REUSEPORT isn't supported on this platform, running a single process")
+        WEB_PROCESSES = 1
+
+    # Each process handles concurrent connections on a pool of WEB_WORKERS threads
+    httpd = create_server(reuse_port=WEB_PROCESSES > 1)
+    workers = [multiprocessing.Process(target=run_worker_process) for _ in range(WEB_PROCESSES - 1)]
+    for worker in workers:
+        worker.start()
+
+    print(f"🚀 Server running on http://{BIND_ADDRESS}:{PORT}")
+    print(f"📂 Serving files from: {SERVE_PATH}")
+    print(f"⚡ Optimizations: Caching, Compression, Threading, Keep-Alive, Pagination")
+    print(f"📊 Cache size limit: {MAX_CACHE_SIZE} thumbnails | Items per page: {ITEMS_PER_PAGE} | Processes: {WEB_PROCESSES} × {WEB_WORKERS} threads")
+    print(f"⏹️  Press Ctrl+C to stop")
+
+    # SIGTERM stops the server like Ctrl+C; set only now so the workers keep the default
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        serve_until_interrupted(httpd)
+    finally:
+        # Whatever stopped this process, the workers must not keep serving the port
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        print("\n✋ Server stopped")